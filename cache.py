@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+CACHE_PATH = Path(__file__).parent / "llm_cache.sqlite3"
+DEFAULT_TTL_SECONDS = 30 * 86400
+
+
+class CommentCache:
+    """Persistent cache of generated comments, shared by the worker threads."""
+
+    def __init__(self, path: Path = CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS comments ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # Expired rows are never read again; drop them so the file does not grow across terms.
+        self._conn.execute("DELETE FROM comments WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, style: str, expected_words: int, reflection_text: str) -> str:
+        raw = f"{model}|{style}|{expected_words}|{reflection_text.strip()}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT text FROM comments WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, text: str) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO comments (key, text, expires_at) VALUES (?, ?, ?)",
+                    (key, text, time.time() + self._ttl_seconds),
+                )
+                self._conn.commit()
+        except sqlite3.Error:
+            # A broken cache must never fail the batch; the comment is simply not reused.
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
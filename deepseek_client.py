@@ -1,10 +1,25 @@
 from __future__ import annotations
 
-import time
+import re
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cache import CommentCache
+
+
+_BATCH_REPLY_RE = re.compile(r"<<<(\d+)>>>(.*?)<<</\1>>>", re.S)
+_DEFAULT_HINT = "语气正式、肯定优点并指出改进点。"
+_STYLE_HINTS = {
+    "标准": _DEFAULT_HINT,
+    "学术": "语气偏学术、客观、强调实验规范与逻辑。",
+    "幽默": "语气轻松幽默但必须尊重鼓励，不讽刺不攻击。",
+    "极简": "用尽量短的句子表达核心评价。",
+}
 
 
 @dataclass
@@ -14,11 +29,48 @@ class DeepSeekConfig:
     model: str
     timeout_seconds: int = 30
     max_retries: int = 2
+    max_connections: int = 8
 
 
 class DeepSeekClient:
-    def __init__(self, config: DeepSeekConfig) -> None:
+    def __init__(self, config: DeepSeekConfig, cache: Optional[CommentCache] = None) -> None:
         self._config = config
+        self._cache = cache
+        base_url = config.base_url.rstrip("/")
+        self._chat_url = f"{base_url}/v1/chat/completions"
+        self._models_url = f"{base_url}/v1/models"
+        self._system_msg = {
+            "role": "system",
+            "content": "你是认真负责的老师，给出简洁、有建设性的中文教师总评。",
+        }
+        # One pooled session per client so a batch reuses keep-alive connections
+        # instead of paying a TCP + TLS handshake for every document.
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Authorization": f"Bearer {config.api_key}",
+                "Content-Type": "application/json",
+            }
+        )
+        # Back off exponentially (with jitter) between attempts and honour Retry-After,
+        # so a 429 does not get hammered while the rest of the batch waits.
+        retry = Retry(
+            total=config.max_retries,
+            backoff_factor=0.5,
+            backoff_jitter=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "POST"),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        # One kept-alive connection per concurrent caller: a smaller pool would discard
+        # connections after use and reconnect, a larger one is never filled.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, config.max_connections), max_retries=retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self._session.close()
 
     def generate_comment(
         self,
@@ -26,63 +78,90 @@ class DeepSeekClient:
         style: str,
         expected_words: int,
     ) -> str:
+        cached = self._cached_comment(reflection_text, style, expected_words)
+        if cached:
+            return cached
         prompt = self._build_prompt(reflection_text, style, expected_words)
-        url = f"{self._config.base_url.rstrip('/')}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self._config.api_key}",
-            "Content-Type": "application/json",
-        }
+        text = self._chat(prompt)
+        self._store_comment(reflection_text, style, expected_words, text)
+        return text
+
+    def generate_comments_batch(
+        self,
+        reflection_texts: List[str],
+        style: str,
+        expected_words: int,
+    ) -> List[Union[str, RuntimeError]]:
+        """Generate one comment per reflection, packing uncached ones into a single request.
+
+        If the batch request fails or its reply cannot be split into exactly one comment per
+        reflection, each one is requested on its own instead. A reflection whose own request
+        fails gets its RuntimeError in place of the comment, so the others are still usable.
+        """
+        results: List[Union[str, RuntimeError, None]] = [
+            self._cached_comment(text, style, expected_words) for text in reflection_texts
+        ]
+        missing = [idx for idx, comment in enumerate(results) if not comment]
+        comments: Optional[List[str]] = None
+        if len(missing) > 1:
+            prompt = self._build_batch_prompt([reflection_texts[idx] for idx in missing], style, expected_words)
+            # The reply is not streamed and grows with every packed comment, so allow the
+            # read as long as the individual requests would have taken together.
+            timeout = (self._config.timeout_seconds, self._config.timeout_seconds * len(missing))
+            try:
+                comments = self._split_batch_reply(self._chat(prompt, timeout=timeout), len(missing))
+            except RuntimeError:
+                comments = None
+        if comments is not None:
+            for idx, comment in zip(missing, comments):
+                self._store_comment(reflection_texts[idx], style, expected_words, comment)
+                results[idx] = comment
+        else:
+            # A single reflection, or the batch failed or its reply did not follow the
+            # numbering; ask for each reflection separately.
+            for idx in missing:
+                try:
+                    results[idx] = self.generate_comment(reflection_texts[idx], style, expected_words)
+                except RuntimeError as exc:
+                    results[idx] = exc
+        return [comment or "" for comment in results]
+
+    def _chat(self, prompt: str, timeout: Union[float, Tuple[float, float], None] = None) -> str:
         payload = {
             "model": self._config.model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是认真负责的老师，给出简洁、有建设性的中文教师总评。",
-                },
-                {"role": "user", "content": prompt},
-            ],
+            "messages": [self._system_msg, {"role": "user", "content": prompt}],
             "temperature": 0.7,
         }
 
-        last_error: Optional[Exception] = None
-        for attempt in range(self._config.max_retries + 1):
-            try:
-                resp = requests.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    timeout=self._config.timeout_seconds,
-                )
-                resp.raise_for_status()
-                data = resp.json()
-                return self._extract_text(data)
-            except Exception as exc:
-                last_error = exc
-                if attempt < self._config.max_retries:
-                    time.sleep(1.0)
-                    continue
-                break
-        raise RuntimeError(f"DeepSeek request failed: {last_error}") from last_error
+        try:
+            # Content-Type is already set on the session, so the body can go out pre-encoded.
+            resp = self._session.post(
+                self._chat_url,
+                data=orjson.dumps(payload),
+                timeout=self._config.timeout_seconds if timeout is None else timeout,
+            )
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
+        except (requests.RequestException, ValueError) as exc:
+            raise RuntimeError(f"DeepSeek request failed: {exc}") from exc
+        return self._extract_text(data)
+
+    def _cached_comment(self, reflection_text: str, style: str, expected_words: int) -> Optional[str]:
+        if self._cache is None:
+            return None
+        return self._cache.get(CommentCache.make_key(self._config.model, style, expected_words, reflection_text))
+
+    def _store_comment(self, reflection_text: str, style: str, expected_words: int, comment: str) -> None:
+        if self._cache is None:
+            return
+        self._cache.set(CommentCache.make_key(self._config.model, style, expected_words, reflection_text), comment)
 
     def test_connection(self) -> None:
-        url = f"{self._config.base_url.rstrip('/')}/v1/models"
-        headers = {
-            "Authorization": f"Bearer {self._config.api_key}",
-            "Content-Type": "application/json",
-        }
-        last_error: Optional[Exception] = None
-        for attempt in range(self._config.max_retries + 1):
-            try:
-                resp = requests.get(url, headers=headers, timeout=self._config.timeout_seconds)
-                resp.raise_for_status()
-                return
-            except Exception as exc:
-                last_error = exc
-                if attempt < self._config.max_retries:
-                    time.sleep(1.0)
-                    continue
-                break
-        raise RuntimeError(f"DeepSeek connection test failed: {last_error}") from last_error
+        try:
+            resp = self._session.get(self._models_url, timeout=self._config.timeout_seconds)
+            resp.raise_for_status()
+        except requests.RequestException as exc:
+            raise RuntimeError(f"DeepSeek connection test failed: {exc}") from exc
 
     @staticmethod
     def _extract_text(data: dict) -> str:
@@ -95,18 +174,34 @@ class DeepSeekClient:
             raise RuntimeError("DeepSeek response content empty.")
         return content.strip()
 
+    @staticmethod
+    def _split_batch_reply(content: str, count: int) -> Optional[List[str]]:
+        found = {int(idx): text.strip() for idx, text in _BATCH_REPLY_RE.findall(content)}
+        comments = [found.get(idx, "") for idx in range(1, count + 1)]
+        if not all(comments):
+            return None
+        return comments
+
     @staticmethod
     def _build_prompt(reflection_text: str, style: str, expected_words: int) -> str:
-        style_hint = {
-            "标准": "语气正式、肯定优点并指出改进点。",
-            "学术": "语气偏学术、客观、强调实验规范与逻辑。",
-            "幽默": "语气轻松幽默但必须尊重鼓励，不讽刺不攻击。",
-            "极简": "用尽量短的句子表达核心评价。",
-        }.get(style, "语气正式、肯定优点并指出改进点。")
         return (
             "请根据下面学生反思生成一段中文“教师总评”，仅一段话，纯文本，无Markdown。"
             f"字数约{expected_words}字，允许上下浮动。"
-            f"{style_hint}\n\n"
+            f"{_STYLE_HINTS.get(style, _DEFAULT_HINT)}\n\n"
             "学生反思：\n"
             f"{reflection_text}"
         )
+
+    @staticmethod
+    def _build_batch_prompt(reflection_texts: List[str], style: str, expected_words: int) -> str:
+        count = len(reflection_texts)
+        sections = "\n\n".join(
+            f"学生反思{idx}：\n{text}" for idx, text in enumerate(reflection_texts, start=1)
+        )
+        return (
+            f"请为以下{count}段学生反思分别生成一段中文“教师总评”，每段评语仅一段话，纯文本，无Markdown。"
+            f"每段字数约{expected_words}字，允许上下浮动。"
+            f"{_STYLE_HINTS.get(style, _DEFAULT_HINT)}"
+            f"第i段评语用 <<<i>>> 和 <<</i>>> 包围（i 为 1 到 {count}），不要输出其他内容。\n\n"
+            f"{sections}"
+        )
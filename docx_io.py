@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import re
+import zipfile
 from pathlib import Path
-from typing import Iterable, Optional, Tuple, Union
+from typing import Iterable, List, Optional, Tuple, Union
 
 from docx import Document
 from docx.document import Document as DocxDocument
-from docx.oxml.table import CT_Tbl
+from docx.oxml.document import CT_Body
+from docx.oxml.ns import nsmap, qn
+from docx.oxml.parser import parse_xml
+from docx.oxml.table import CT_Tbl, CT_Tc
 from docx.oxml.text.paragraph import CT_P
-from docx.table import Table, _Cell
+from docx.table import _Cell
 from docx.text.paragraph import Paragraph
+from lxml import etree
 
 
 REFLECTION_MARKER = "[[REFLECTION_CELL]]"
@@ -19,6 +25,29 @@ REFLECTION_KEYWORDS = [
     "心得与反思",
     "Student's Reflection",
 ]
+_P_TAG = qn("w:p")
+_TBL_TAG = qn("w:tbl")
+_RUN_CONTENT = "*[self::w:t or self::w:tab or self::w:br or self::w:cr or self::w:noBreakHyphen or self::w:ptab]"
+# Run content that Paragraph.text renders (text, tabs, breaks, hyphens), including runs
+# nested in hyperlinks. Compiled once instead of per paragraph and per run.
+_PARAGRAPH_TEXT_XPATH = etree.XPath(
+    f"(w:r | w:hyperlink/w:r)/{_RUN_CONTENT}",
+    namespaces={"w": nsmap["w"]},
+)
+# The same run content for every paragraph the marker searches visit: body paragraphs and
+# the cell paragraphs of top-level tables, from a body or from a single w:tbl.
+_SEARCHED_TEXT_XPATH = etree.XPath(
+    "(w:p/w:r | w:p/w:hyperlink/w:r"
+    " | w:tbl/w:tr/w:tc/w:p/w:r | w:tbl/w:tr/w:tc/w:p/w:hyperlink/w:r"
+    f" | w:tr/w:tc/w:p/w:r | w:tr/w:tc/w:p/w:hyperlink/w:r)/{_RUN_CONTENT}",
+    namespaces={"w": nsmap["w"]},
+)
+# One alternation so each cell is scanned once instead of once per keyword.
+_KEYWORD_RE = re.compile("|".join(map(re.escape, REFLECTION_KEYWORDS)))
+
+
+def open_document(doc_path: Path) -> DocxDocument:
+    return Document(str(doc_path))
 
 
 def extract_reflection_text(
@@ -27,27 +56,33 @@ def extract_reflection_text(
     start_marker: Optional[str] = None,
     end_marker: Optional[str] = None,
 ) -> Optional[str]:
-    doc = Document(str(doc_path))
-    marker_text = _find_reflection_by_range_markers(doc, start_marker, end_marker)
-    if marker_text:
-        return _clean_text(marker_text, max_chars)
-    marker_text = _find_reflection_by_marker(doc)
-    if marker_text:
-        return _clean_text(marker_text, max_chars)
-    fallback_text = _find_reflection_by_keywords(doc)
-    if fallback_text:
-        return _clean_text(fallback_text, max_chars)
+    body = _read_body(doc_path)
+    # Every strategy needs its marker or a keyword inside some paragraph; one pass over the
+    # rendered text rules out files that have none, before any per-table work.
+    raw_text = _raw_text(body)
+    if start_marker and _may_contain(raw_text, start_marker):
+        marker_text = _find_reflection_by_range_markers(body, start_marker, end_marker)
+        if marker_text:
+            return _clean_text(marker_text, max_chars)
+    if _may_contain(raw_text, REFLECTION_MARKER):
+        marker_text = _find_reflection_by_marker(body)
+        if marker_text:
+            return _clean_text(marker_text, max_chars)
+    if _KEYWORD_RE.search(raw_text):
+        fallback_text = _find_reflection_by_keywords(body)
+        if fallback_text:
+            return _clean_text(fallback_text, max_chars)
     return None
 
 
 def insert_comment_and_save(
+    doc: DocxDocument,
     doc_path: Path,
     comment_text: str,
     output_dir: Path,
     comment_label: Optional[str] = None,
     overwrite_output: bool = True,
 ) -> Optional[Path]:
-    doc = Document(str(doc_path))
     inserted = _insert_comment(doc, comment_text, comment_label)
     if not inserted:
         return None
@@ -57,88 +92,105 @@ def insert_comment_and_save(
     return output_path
 
 
+def _read_body(doc_path: Path) -> CT_Body:
+    # Extraction is read-only, so parse just the main document part instead of loading the
+    # whole package (styles, numbering, headers, media) through Document().
+    try:
+        with zipfile.ZipFile(doc_path) as archive:
+            xml = archive.read("word/document.xml")
+    except KeyError:
+        # Main part stored under a non-standard name; let python-docx resolve it.
+        return open_document(doc_path).element.body
+    return parse_xml(xml).body
+
+
 def _find_reflection_by_range_markers(
-    doc: Document,
+    body: CT_Body,
     start_marker: Optional[str],
     end_marker: Optional[str],
 ) -> Optional[str]:
     if not start_marker or not end_marker:
         return None
-    collecting = False
+    # Phase 1: find the block holding the start marker. Tables are only serialized when
+    # their paragraph text can contain the marker at all.
+    start_block = None
+    block_text = ""
+    for block in _iter_block_items(body):
+        if block.tag == _TBL_TAG and not _may_contain(_raw_text(block), start_marker):
+            continue
+        block_text = _block_text(block).strip()
+        if start_marker in block_text:
+            start_block = block
+            break
+    if start_block is None:
+        return None
+
+    # Phase 2: collect the following blocks until the end marker.
     parts: list[str] = []
-    for block in _iter_block_items(doc):
+    after = block_text.split(start_marker, 1)[1].strip()
+    if end_marker in after:
+        before = after.split(end_marker, 1)[0].strip()
+        return before or None
+    if after:
+        parts.append(after)
+    for block in start_block.itersiblings(_P_TAG, _TBL_TAG):
         block_text = _block_text(block).strip()
         if not block_text:
             continue
-        if not collecting:
-            if start_marker in block_text:
-                collecting = True
-                after = block_text.split(start_marker, 1)[1].strip()
-                if end_marker in after:
-                    before = after.split(end_marker, 1)[0].strip()
-                    if before:
-                        parts.append(before)
-                    break
-                if after:
-                    parts.append(after)
-        else:
-            if end_marker in block_text:
-                before = block_text.split(end_marker, 1)[0].strip()
-                if before:
-                    parts.append(before)
-                break
-            parts.append(block_text)
+        if end_marker in block_text:
+            before = block_text.split(end_marker, 1)[0].strip()
+            if before:
+                parts.append(before)
+            break
+        parts.append(block_text)
     if parts:
         return "\n".join(parts)
     return None
 
 
-def _find_reflection_by_marker(doc: Document) -> Optional[str]:
-    for cell in _iter_cells(doc):
-        text = cell.text or ""
-        if REFLECTION_MARKER in text:
-            return text.replace(REFLECTION_MARKER, "")
+def _find_reflection_by_marker(body: CT_Body) -> Optional[str]:
+    for tbl in body.tbl_lst:
+        for tr in tbl.tr_lst:
+            for tc in tr.tc_lst:
+                text = _tc_text(tc)
+                if REFLECTION_MARKER in text:
+                    return text.replace(REFLECTION_MARKER, "")
     return None
 
 
-def _find_reflection_by_keywords(doc: Document) -> Optional[str]:
-    for table in doc.tables:
-        hit = _find_keyword_cell(table)
+def _find_reflection_by_keywords(body: CT_Body) -> Optional[str]:
+    for tbl in body.tbl_lst:
+        grid = _snapshot_table(tbl)
+        hit = _find_keyword_cell(grid)
         if hit:
-            label_cell, row_idx, col_idx = hit
+            row_idx, col_idx = hit
             # Try right cell first
-            if col_idx + 1 < len(table.rows[row_idx].cells):
-                right_cell = table.rows[row_idx].cells[col_idx + 1]
-                right_text = right_cell.text.strip()
+            if col_idx + 1 < len(grid[row_idx]):
+                right_text = grid[row_idx][col_idx + 1][1].strip()
                 if right_text:
                     return right_text
             # Try below cell
-            if row_idx + 1 < len(table.rows):
-                below_cell = table.rows[row_idx + 1].cells[col_idx]
-                below_text = below_cell.text.strip()
+            if row_idx + 1 < len(grid) and col_idx < len(grid[row_idx + 1]):
+                below_text = grid[row_idx + 1][col_idx][1].strip()
                 if below_text:
                     return below_text
             # Fallback to same cell content, removing keyword line
-            cell_text = label_cell.text
-            for kw in REFLECTION_KEYWORDS:
-                cell_text = cell_text.replace(kw, "")
+            cell_text = _KEYWORD_RE.sub("", grid[row_idx][col_idx][1])
             if cell_text.strip():
                 return cell_text
     return None
 
 
-def _find_keyword_cell(table: Table) -> Optional[Tuple[_Cell, int, int]]:
-    for r_idx, row in enumerate(table.rows):
-        for c_idx, cell in enumerate(row.cells):
-            text = cell.text or ""
-            for kw in REFLECTION_KEYWORDS:
-                if kw in text:
-                    return cell, r_idx, c_idx
+def _find_keyword_cell(grid: List[List[Tuple[CT_Tc, str]]]) -> Optional[Tuple[int, int]]:
+    for r_idx, row in enumerate(grid):
+        for c_idx, (_, text) in enumerate(row):
+            if _KEYWORD_RE.search(text):
+                return r_idx, c_idx
     return None
 
 
 def _insert_comment(doc: Document, comment_text: str, comment_label: Optional[str]) -> bool:
-    if _replace_comment_marker(doc, comment_text):
+    if _may_contain(_raw_text(doc.element.body), COMMENT_MARKER) and _replace_comment_marker(doc, comment_text):
         return True
     label = comment_label or "教师总评"
     return _insert_after_teacher_label(doc, comment_text, label)
@@ -146,41 +198,48 @@ def _insert_comment(doc: Document, comment_text: str, comment_label: Optional[st
 
 def _replace_comment_marker(doc: Document, comment_text: str) -> bool:
     replaced = False
-    for para in doc.paragraphs:
-        if COMMENT_MARKER in para.text:
-            para.text = para.text.replace(COMMENT_MARKER, comment_text)
-            replaced = True
+    for p in doc.element.body.p_lst:
+        replaced |= _replace_in_paragraph(p, doc, COMMENT_MARKER, comment_text)
     for cell in _iter_cells(doc):
-        for para in cell.paragraphs:
-            if COMMENT_MARKER in para.text:
-                para.text = para.text.replace(COMMENT_MARKER, comment_text)
-                replaced = True
+        for p in cell._tc.p_lst:
+            replaced |= _replace_in_paragraph(p, cell, COMMENT_MARKER, comment_text)
     return replaced
 
 
+def _replace_in_paragraph(p: CT_P, parent: Union[DocxDocument, _Cell], old: str, new: str) -> bool:
+    # Read the text once from the element and only wrap the paragraph that gets rewritten.
+    text = _paragraph_text(p)
+    if old not in text:
+        return False
+    Paragraph(p, parent).text = text.replace(old, new)
+    return True
+
+
 def _insert_after_teacher_label(doc: Document, comment_text: str, label: str) -> bool:
     # Paragraphs first
-    for para in doc.paragraphs:
-        if label in para.text:
-            if para.text.strip() == label:
-                para.text = f"{label}\n{comment_text}"
+    for p in doc.element.body.p_lst:
+        text = _paragraph_text(p)
+        if label in text:
+            if text.strip() == label:
+                Paragraph(p, doc).text = f"{label}\n{comment_text}"
             else:
-                para.text = para.text.replace(label, f"{label}\n{comment_text}", 1)
+                Paragraph(p, doc).text = text.replace(label, f"{label}\n{comment_text}", 1)
             return True
     # Tables
     for table in doc.tables:
-        for row in table.rows:
-            for c_idx, cell in enumerate(row.cells):
-                if label in (cell.text or ""):
+        for row in _snapshot_table(table._tbl):
+            for c_idx, (tc, text) in enumerate(row):
+                if label in text:
                     # Prefer right cell for content
-                    if c_idx + 1 < len(row.cells):
-                        target = row.cells[c_idx + 1]
+                    if c_idx + 1 < len(row):
+                        target = _Cell(row[c_idx + 1][0], table)
                         if target.paragraphs:
                             target.paragraphs[0].text = comment_text
                         else:
                             target.add_paragraph(comment_text)
                         return True
                     # Otherwise same cell
+                    cell = _Cell(tc, table)
                     if cell.paragraphs:
                         cell.paragraphs[0].text = cell.paragraphs[0].text.replace(
                             label, f"{label}\n{comment_text}", 1
@@ -192,32 +251,75 @@ def _insert_after_teacher_label(doc: Document, comment_text: str, label: str) ->
 
 
 def _iter_cells(doc: Document) -> Iterable[_Cell]:
+    # Walk the w:tc elements directly; row.cells rebuilds the merged-cell grid on every access.
     for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                yield cell
-
-
-def _iter_block_items(parent: Union[DocxDocument, _Cell]) -> Iterable[Union[Paragraph, Table]]:
-    if isinstance(parent, DocxDocument):
-        parent_elm = parent.element.body
-    else:
-        parent_elm = parent._tc
-    for child in parent_elm.iterchildren():
-        if isinstance(child, CT_P):
-            yield Paragraph(child, parent)
-        elif isinstance(child, CT_Tbl):
-            yield Table(child, parent)
-
-
-def _block_text(block: Union[Paragraph, Table]) -> str:
-    if isinstance(block, Paragraph):
-        return block.text or ""
-    if isinstance(block, Table):
+        for tr in table._tbl.tr_lst:
+            for tc in tr.tc_lst:
+                yield _Cell(tc, table)
+
+
+def _snapshot_table(tbl: CT_Tbl) -> List[List[Tuple[CT_Tc, str]]]:
+    """Return the rows of ``tbl`` as ``(tc, text)`` pairs laid out like ``row.cells``.
+
+    Merged cells are resolved in a single pass: a horizontal span repeats its cell and a
+    vertical continuation points at the cell above, matching what python-docx reports.
+    """
+    grid: List[List[Tuple[CT_Tc, str]]] = []
+    above: dict[int, Tuple[CT_Tc, str]] = {}
+    for tr in tbl.tr_lst:
+        row: List[Tuple[CT_Tc, str]] = []
+        current: dict[int, Tuple[CT_Tc, str]] = {}
+        offset = tr.grid_before
+        for tc in tr.tc_lst:
+            span = tc.grid_span
+            entry = above.get(offset) if tc.vMerge == "continue" else None
+            if entry is None:
+                entry = (tc, _tc_text(tc))
+            for idx in range(span):
+                row.append(entry)
+                current[offset + idx] = entry
+            offset += span
+        grid.append(row)
+        above = current
+    return grid
+
+
+def _tc_text(tc: CT_Tc) -> str:
+    # Same result as _Cell.text, without building a Paragraph wrapper per paragraph.
+    return "\n".join(_paragraph_text(p) for p in tc.p_lst)
+
+
+def _paragraph_text(p: CT_P) -> str:
+    # Same result as Paragraph.text; the custom element classes map w:tab/w:br via str().
+    return "".join(str(node) for node in _PARAGRAPH_TEXT_XPATH(p))
+
+
+def _raw_text(element: etree._Element) -> str:
+    # The text of every searched paragraph under `element` (a body or a w:tbl), rendered
+    # like Paragraph.text and concatenated in document order by one compiled XPath.
+    return "".join(str(node) for node in _SEARCHED_TEXT_XPATH(element))
+
+
+def _may_contain(raw_text: str, marker: str) -> bool:
+    # Each paragraph's text is a substring of raw_text, so a marker missing from it is in no
+    # paragraph. Block and cell texts also join paragraphs with "\n", which raw_text does
+    # not reproduce, so a marker containing one is never ruled out.
+    return "\n" in marker or marker in raw_text
+
+
+def _iter_block_items(parent: Union[CT_Body, CT_Tc]) -> Iterable[Union[CT_P, CT_Tbl]]:
+    # Let lxml filter on the tag; callers only need text, so no Paragraph/Table wrappers.
+    return parent.iterchildren(_P_TAG, _TBL_TAG)
+
+
+def _block_text(block: Union[CT_P, CT_Tbl]) -> str:
+    if block.tag == _P_TAG:
+        return _paragraph_text(block)
+    if block.tag == _TBL_TAG:
         parts: list[str] = []
-        for row in block.rows:
-            for cell in row.cells:
-                text = cell.text.strip()
+        for row in _snapshot_table(block):
+            for _, cell_text in row:
+                text = cell_text.strip()
                 if text:
                     parts.append(text)
         return "\n".join(parts)
@@ -225,7 +327,9 @@ def _block_text(block: Union[Paragraph, Table]) -> str:
 
 
 def _clean_text(text: str, max_chars: int) -> str:
-    normalized = " ".join(text.replace("\r", "\n").split())
+    # str.split() already treats \r (and every other str.isspace() char) as a separator;
+    # split/join also beats a \s+ regex substitution in CPython.
+    normalized = " ".join(text.split())
     if len(normalized) > max_chars:
         return normalized[:max_chars]
     return normalized
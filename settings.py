@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-import json
+import hashlib
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
+
+import orjson
 
 
 SETTINGS_PATH = Path(__file__).parent / "settings.json"
 
+# Digest of what settings.json currently holds, so unchanged settings are not rewritten.
+_last_saved_digest: Optional[bytes] = None
+
 
 @dataclass
 class AppSettings:
@@ -20,14 +25,18 @@ class AppSettings:
     end_marker: str = ""
     comment_label: str = ""
     overwrite_output: bool = True
+    concurrency: int = 4
+    batch_size: int = 1
+    last_folder: str = ""
 
 
 def load_settings() -> AppSettings:
+    global _last_saved_digest
     if not SETTINGS_PATH.exists():
         return AppSettings()
     try:
-        raw = json.loads(SETTINGS_PATH.read_text(encoding="utf-8"))
-        return AppSettings(
+        raw = orjson.loads(SETTINGS_PATH.read_bytes())
+        settings = AppSettings(
             base_url=str(raw.get("base_url", AppSettings.base_url)),
             api_key=str(raw.get("api_key", "")),
             model=str(raw.get("model", AppSettings.model)),
@@ -37,12 +46,26 @@ def load_settings() -> AppSettings:
             end_marker=str(raw.get("end_marker", "")),
             comment_label=str(raw.get("comment_label", "")),
             overwrite_output=bool(raw.get("overwrite_output", True)),
+            concurrency=int(raw.get("concurrency", AppSettings.concurrency)),
+            batch_size=int(raw.get("batch_size", AppSettings.batch_size)),
+            last_folder=str(raw.get("last_folder", "")),
         )
     except Exception:
         # If settings are corrupted, fall back to defaults.
         return AppSettings()
+    _last_saved_digest = _digest(raw)
+    return settings
 
 
 def save_settings(settings: AppSettings) -> None:
+    global _last_saved_digest
     data: dict[str, Any] = asdict(settings)
-    SETTINGS_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    digest = _digest(data)
+    if digest == _last_saved_digest and SETTINGS_PATH.exists():
+        return
+    SETTINGS_PATH.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    _last_saved_digest = digest
+
+
+def _digest(data: Any) -> bytes:
+    return hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import multiprocessing
+import re
 import sys
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from PyQt6.QtGui import QIcon, QColor, QTextCharFormat
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QCloseEvent, QIcon, QColor, QTextCharFormat, QTextCursor
 from PyQt6.QtWidgets import (
     QApplication,
     QDialog,
@@ -18,7 +22,7 @@ from PyQt6.QtWidgets import (
     QMessageBox,
     QPushButton,
     QSpinBox,
-    QTextEdit,
+    QPlainTextEdit,
     QVBoxLayout,
     QWidget,
     QComboBox,
@@ -104,12 +108,7 @@ QLineEdit:focus, QComboBox:focus, QSpinBox:focus {
     border-color: #3498db;
 }
 
-QLineEdit:read-only {
-    background-color: #ecf0f1;
-    color: #7f8c8d;
-}
-
-QTextEdit {
+#logView {
     border: 1px solid #bdc3c7;
     border-radius: 4px;
     background-color: #ffffff;
@@ -134,6 +133,11 @@ QLabel {
     font-size: 13px;
 }
 
+QLabel#currentFileLabel {
+    color: #7f8c8d;
+    font-style: italic;
+}
+
 QCheckBox {
     color: #2c3e50;
     font-size: 13px;
@@ -145,9 +149,17 @@ QCheckBox::indicator {
 }
 """
 
-from deepseek_client import DeepSeekClient, DeepSeekConfig
 from settings import AppSettings, load_settings, save_settings
-from worker import BatchWorker
+
+if TYPE_CHECKING:
+    from worker import BatchWorker
+
+# Keyword sets used to colour worker log lines, one precompiled alternation each.
+_LOG_DONE_RE = re.compile("已保存|完成|成功|跳过")
+_LOG_DONE_FAILED_RE = re.compile("失败|错误")
+_LOG_DONE_SKIPPED_RE = re.compile("跳过|未找到")
+_LOG_ERROR_RE = re.compile("失败|错误|error|failed")
+_LOG_WARNING_RE = re.compile("警告|warning|未找到|跳过")
 
 
 class SettingsDialog(QDialog):
@@ -189,6 +201,11 @@ class SettingsDialog(QDialog):
         buttons.addWidget(self.save_btn)
         buttons.addWidget(self.cancel_btn)
 
+    def load_from_settings(self, settings: AppSettings) -> None:
+        self.base_url_edit.setText(settings.base_url)
+        self.api_key_edit.setText(settings.api_key)
+        self.model_edit.setText(settings.model)
+
     def apply_to_settings(self, settings: AppSettings) -> None:
         settings.base_url = self.base_url_edit.text().strip()
         settings.api_key = self.api_key_edit.text().strip()
@@ -201,6 +218,9 @@ class SettingsDialog(QDialog):
         if not base_url or not api_key or not model:
             QMessageBox.warning(self, "提示", "请填写完整的 Base URL / API Key / Model。")
             return
+        # requests/urllib3 are only imported once the network is actually needed.
+        from deepseek_client import DeepSeekClient, DeepSeekConfig
+
         client = DeepSeekClient(
             DeepSeekConfig(
                 base_url=base_url,
@@ -215,6 +235,8 @@ class SettingsDialog(QDialog):
             QMessageBox.information(self, "成功", "连接成功。")
         except Exception as exc:
             QMessageBox.critical(self, "失败", f"连接失败：{exc}")
+        finally:
+            client.close()
 
 
 class MainWindow(QMainWindow):
@@ -223,10 +245,12 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("DocAutoReviewer")
         self.resize(800, 520)
         self._set_window_icon()
-        self.setStyleSheet(STYLESHEET)
 
-        self.settings = load_settings()
+        # Widgets start from the defaults; the saved settings are applied once the window is up.
+        self.settings = AppSettings()
         self.worker: BatchWorker | None = None
+        # Built on first use and reused; its fields are re-synced from settings on every open.
+        self._settings_dialog: SettingsDialog | None = None
 
         root = QWidget(self)
         self.setCentralWidget(root)
@@ -280,6 +304,15 @@ class MainWindow(QMainWindow):
         self.words_spin.setValue(self.settings.expected_words)
         self.words_spin.setSuffix(" 字")
 
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(self.settings.concurrency)
+
+        self.batch_spin = QSpinBox()
+        self.batch_spin.setRange(1, 10)
+        self.batch_spin.setValue(self.settings.batch_size)
+        self.batch_spin.setSuffix(" 篇")
+
         self.overwrite_check = QCheckBox("覆盖已有输出")
         self.overwrite_check.setChecked(self.settings.overwrite_output)
 
@@ -293,7 +326,11 @@ class MainWindow(QMainWindow):
         config_layout.addWidget(self.style_combo, 3, 1)
         config_layout.addWidget(QLabel("字数"), 3, 2)
         config_layout.addWidget(self.words_spin, 3, 3)
-        config_layout.addWidget(self.overwrite_check, 4, 0, 1, 4)
+        config_layout.addWidget(QLabel("并发数"), 4, 0)
+        config_layout.addWidget(self.concurrency_spin, 4, 1)
+        config_layout.addWidget(QLabel("每批篇数"), 4, 2)
+        config_layout.addWidget(self.batch_spin, 4, 3)
+        config_layout.addWidget(self.overwrite_check, 5, 0, 1, 4)
         config_layout.setColumnStretch(1, 1)
         config_layout.setColumnStretch(3, 1)
 
@@ -305,14 +342,6 @@ class MainWindow(QMainWindow):
         api_layout.setSpacing(8)
         api_layout.setContentsMargins(10, 16, 10, 10)
 
-        # 隐藏字段（用于保存和读取）
-        self.base_url_edit = QLineEdit(self.settings.base_url)
-        self.api_key_edit = QLineEdit(self.settings.api_key)
-        self.model_edit = QLineEdit(self.settings.model)
-        self.base_url_edit.hide()
-        self.api_key_edit.hide()
-        self.model_edit.hide()
-
         # 精简显示
         self.api_status_label = QLabel()
         self._update_api_status_label()
@@ -331,9 +360,28 @@ class MainWindow(QMainWindow):
         log_layout.setSpacing(6)
         log_layout.setContentsMargins(10, 16, 10, 10)
 
-        self.log = QTextEdit()
+        self.log = QPlainTextEdit()
+        self.log.setObjectName("logView")
         self.log.setReadOnly(True)
+        # Keep only the latest lines so long batches don't slow down layout or grow memory.
+        self.log.setMaximumBlockCount(2000)
         log_layout.addWidget(self.log)
+        # Worker messages arrive in bursts; collect them and repaint the log at most ~20x/s.
+        self._log_buf: list[tuple[str, str]] = []
+        self._log_timer = QTimer(self)
+        self._log_timer.setInterval(50)
+        self._log_timer.setSingleShot(True)
+        self._log_timer.timeout.connect(self._flush_log)
+        self._log_formats: dict[str, QTextCharFormat] = {}
+        for level, color in {
+            "info": "#2c3e50",
+            "success": "#27ae60",
+            "warning": "#f39c12",
+            "error": "#e74c3c",
+        }.items():
+            log_format = QTextCharFormat()
+            log_format.setForeground(QColor(color))
+            self._log_formats[level] = log_format
 
         clear_log_row = QHBoxLayout()
         clear_log_row.addStretch(1)
@@ -356,7 +404,7 @@ class MainWindow(QMainWindow):
         self.progress.setValue(0)
         self.progress.setFixedHeight(20)
         self.current_file_label = QLabel("当前文件：-")
-        self.current_file_label.setStyleSheet("color: #7f8c8d; font-style: italic;")
+        self.current_file_label.setObjectName("currentFileLabel")
         self.current_file_label.setFixedWidth(200)
         progress_row.addWidget(self.progress, 1)
         progress_row.addWidget(self.current_file_label)
@@ -392,15 +440,33 @@ class MainWindow(QMainWindow):
 
         main_layout.addLayout(buttons)
 
+        QTimer.singleShot(0, self._load_and_apply_settings)
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        if self.worker:
+            # Let the current file finish so the HTTP session is idle before closing it.
+            self.worker.stop()
+            self.worker.wait()
+            self.worker.close()
+        super().closeEvent(event)
+
     def _update_api_status_label(self) -> None:
         model = self.settings.model or "未配置"
         has_key = "已配置" if self.settings.api_key else "未配置"
         self.api_status_label.setText(f"模型: {model}\nAPI Key: {has_key}")
 
     def _pick_folder(self) -> None:
-        folder = QFileDialog.getExistingDirectory(self, "选择输入文件夹")
+        # Start from the last picked folder; it is kept in settings.json across sessions.
+        folder = QFileDialog.getExistingDirectory(
+            self,
+            "选择输入文件夹",
+            self.settings.last_folder,
+            QFileDialog.Option.ShowDirsOnly,
+        )
         if folder:
             self.input_dir_edit.setText(folder)
+            self.settings.last_folder = folder
+            save_settings(self.settings)
 
     def _set_window_icon(self) -> None:
         base_dir = Path(getattr(sys, "_MEIPASS", Path(__file__).parent))
@@ -413,32 +479,40 @@ class MainWindow(QMainWindow):
         if not input_dir.exists():
             QMessageBox.warning(self, "提示", "请输入有效的输入文件夹。")
             return
-        if not self.api_key_edit.text().strip():
+        if not self.settings.api_key:
             QMessageBox.warning(self, "提示", "请输入 API Key。")
             return
 
         self._save_settings()
         self._append_log("开始处理。")
 
+        if self.worker:
+            self.worker.close()
+
+        # The worker pulls in requests, python-docx and lxml; keep them off the startup path.
+        from worker import BatchWorker
+
         self.worker = BatchWorker(
             input_dir=input_dir,
-            base_url=self.base_url_edit.text().strip(),
-            api_key=self.api_key_edit.text().strip(),
-            model=self.model_edit.text().strip(),
+            base_url=self.settings.base_url,
+            api_key=self.settings.api_key,
+            model=self.settings.model,
             style=self.style_combo.currentText(),
             expected_words=int(self.words_spin.value()),
             start_marker=self.start_marker_edit.text().strip(),
             end_marker=self.end_marker_edit.text().strip(),
             comment_label=self.comment_label_edit.text().strip(),
             overwrite_output=self.overwrite_check.isChecked(),
+            concurrency=int(self.concurrency_spin.value()),
+            batch_size=int(self.batch_spin.value()),
         )
-        self.worker.progress_changed.connect(self.progress.setValue)
-        self.worker.current_file_changed.connect(
-            lambda name: self.current_file_label.setText(f"当前文件：{name}")
-        )
-        self.worker.log_message.connect(self._on_worker_log)
-        self.worker.attention_message.connect(self._show_attention)
-        self.worker.finished_all.connect(self._finished)
+        # The worker emits from its own thread; queue every signal onto the GUI thread.
+        queued = Qt.ConnectionType.QueuedConnection
+        self.worker.batch_update.connect(self._on_batch_update, queued)
+        self.worker.current_file_changed.connect(self._on_current_file_changed, queued)
+        self.worker.log_message.connect(self._on_worker_log, queued)
+        self.worker.attention_message.connect(self._show_attention, queued)
+        self.worker.finished_all.connect(self._finished, queued)
 
         self._set_running_state(True)
         self.worker.start()
@@ -475,15 +549,32 @@ class MainWindow(QMainWindow):
         self.stop_btn.setEnabled(running)
 
     def _append_log(self, message: str, level: str = "info") -> None:
+        self._log_buf.append((level, message))
+        if not self._log_timer.isActive():
+            self._log_timer.start()
+
+    def _flush_log(self) -> None:
+        if not self._log_buf:
+            return
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        color_map = {
-            "info": "#2c3e50",
-            "success": "#27ae60",
-            "warning": "#f39c12",
-            "error": "#e74c3c",
-        }
-        color = color_map.get(level, "#2c3e50")
-        self.log.append(f'<span style="color:{color}">[{ts}] {message}</span>')
+        # Follow new output like append() did, unless the user has scrolled up.
+        scroll_bar = self.log.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+        document = self.log.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        self.log.setUpdatesEnabled(False)
+        cursor.beginEditBlock()
+        for level, message in self._log_buf:
+            # One block per line, like appendPlainText(), so the block limit trims whole lines.
+            if not document.isEmpty():
+                cursor.insertBlock()
+            cursor.insertText(f"[{ts}] {message}", self._log_formats.get(level, self._log_formats["info"]))
+        cursor.endEditBlock()
+        self.log.setUpdatesEnabled(True)
+        self._log_buf.clear()
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
 
     def _append_success(self, message: str) -> None:
         self._append_log(message, "success")
@@ -494,65 +585,93 @@ class MainWindow(QMainWindow):
     def _append_error(self, message: str) -> None:
         self._append_log(message, "error")
 
+    def _on_current_file_changed(self, name: str) -> None:
+        self.current_file_label.setText(f"当前文件：{name}")
+
+    def _on_batch_update(self, update: dict) -> None:
+        percent = update.get("percent")
+        if percent is not None:
+            self.progress.setValue(percent)
+        for message in update["messages"]:
+            self._on_worker_log(message)
+
     def _on_worker_log(self, message: str) -> None:
         """根据消息内容自动判断日志级别"""
-        msg_lower = message.lower()
-        if any(kw in message for kw in ["已保存", "完成", "成功", "跳过"]):
-            if "失败" in message or "错误" in message:
-                self._append_error(message)
-            elif "跳过" in message or "未找到" in message:
-                self._append_warning(message)
+        if _LOG_DONE_RE.search(message):
+            if _LOG_DONE_FAILED_RE.search(message):
+                level = "error"
+            elif _LOG_DONE_SKIPPED_RE.search(message):
+                level = "warning"
             else:
-                self._append_success(message)
-        elif any(kw in message for kw in ["失败", "错误", "error", "failed"]):
-            self._append_error(message)
-        elif any(kw in message for kw in ["警告", "warning", "未找到", "跳过"]):
-            self._append_warning(message)
+                level = "success"
+        elif _LOG_ERROR_RE.search(message):
+            level = "error"
+        elif _LOG_WARNING_RE.search(message):
+            level = "warning"
         else:
-            self._append_log(message)
+            level = "info"
+        self._append_log(message, level)
 
     def _clear_log(self) -> None:
+        self._log_buf.clear()
         self.log.clear()
 
     def _show_attention(self, message: str) -> None:
         QMessageBox.warning(self, "提示", message)
 
     def _open_settings(self) -> None:
-        dialog = SettingsDialog(self, self.settings)
+        if self._settings_dialog is None:
+            self._settings_dialog = SettingsDialog(self, self.settings)
+        else:
+            self._settings_dialog.load_from_settings(self.settings)
+        dialog = self._settings_dialog
         if dialog.exec() == QDialog.DialogCode.Accepted:
             dialog.apply_to_settings(self.settings)
             save_settings(self.settings)
             self._refresh_settings_fields()
             QMessageBox.information(self, "已保存", "设置已保存。")
 
+    def _load_and_apply_settings(self) -> None:
+        self.settings = load_settings()
+        self._refresh_settings_fields()
+
     def _refresh_settings_fields(self) -> None:
-        self.base_url_edit.setText(self.settings.base_url)
-        self.api_key_edit.setText(self.settings.api_key)
-        self.model_edit.setText(self.settings.model)
         self.start_marker_edit.setText(self.settings.start_marker)
         self.end_marker_edit.setText(self.settings.end_marker)
         self.comment_label_edit.setText(self.settings.comment_label)
+        if self.settings.style in ["标准", "学术", "幽默", "极简"]:
+            self.style_combo.setCurrentText(self.settings.style)
+        self.words_spin.setValue(self.settings.expected_words)
         self.overwrite_check.setChecked(self.settings.overwrite_output)
+        self.concurrency_spin.setValue(self.settings.concurrency)
+        self.batch_spin.setValue(self.settings.batch_size)
         self._update_api_status_label()
 
     def _save_settings(self) -> None:
         settings = AppSettings(
-            base_url=self.base_url_edit.text().strip(),
-            api_key=self.api_key_edit.text().strip(),
-            model=self.model_edit.text().strip(),
+            base_url=self.settings.base_url,
+            api_key=self.settings.api_key,
+            model=self.settings.model,
             style=self.style_combo.currentText(),
             expected_words=int(self.words_spin.value()),
             start_marker=self.start_marker_edit.text().strip(),
             end_marker=self.end_marker_edit.text().strip(),
             comment_label=self.comment_label_edit.text().strip(),
             overwrite_output=self.overwrite_check.isChecked(),
+            concurrency=int(self.concurrency_spin.value()),
+            batch_size=int(self.batch_spin.value()),
+            last_folder=self.settings.last_folder,
         )
         save_settings(settings)
         self.settings = settings
 
 
 def main() -> None:
+    # Required for the extraction process pool in the frozen (PyInstaller) build.
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
+    # One application-wide stylesheet, parsed once; widgets must not set their own.
+    app.setStyleSheet(STYLESHEET)
     base_dir = Path(getattr(sys, "_MEIPASS", Path(__file__).parent))
     icon_path = base_dir / "report.ico"
     if icon_path.exists():
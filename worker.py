@@ -1,17 +1,29 @@
 from __future__ import annotations
 
-import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple, Union
 
-from PyQt6.QtCore import QThread, pyqtSignal
+import orjson
+from PyQt6.QtCore import QMutex, QMutexLocker, QObject, QThread, QWaitCondition, pyqtSignal
 
+from cache import CommentCache
 from deepseek_client import DeepSeekClient, DeepSeekConfig
-from docx_io import extract_reflection_text, insert_comment_and_save
+from docx_io import extract_reflection_text, insert_comment_and_save, open_document
 
 
-class BatchWorker(QThread):
-    progress_changed = pyqtSignal(int)
+class BatchWorker(QObject):
+    """Batch job that lives on its own QThread; start() launches it, wait() joins it."""
+
+    PROGRESS_FLUSH_SECONDS = 2.0
+
+    # One queued signal per finished file: {"percent": int (only when it changed), "messages": [str]}.
+    batch_update = pyqtSignal(dict)
     current_file_changed = pyqtSignal(str)
     log_message = pyqtSignal(str)
     attention_message = pyqtSignal(str)
@@ -29,9 +41,11 @@ class BatchWorker(QThread):
         end_marker: str,
         comment_label: str,
         overwrite_output: bool,
-        parent=None,
+        concurrency: int = 4,
+        batch_size: int = 1,
     ) -> None:
-        super().__init__(parent)
+        super().__init__()
+        self._thread: QThread | None = None
         self.input_dir = input_dir
         self.style = style
         self.expected_words = expected_words
@@ -39,8 +53,25 @@ class BatchWorker(QThread):
         self.end_marker = end_marker
         self.comment_label = comment_label
         self.overwrite_output = overwrite_output
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
         self._paused = False
         self._stop_requested = False
+        # A paused run sleeps on this condition until resume() or stop() wakes it.
+        self._pause_mutex = QMutex()
+        self._pause_cond = QWaitCondition()
+        self._save_lock = threading.Lock()
+        # progress.json is rewritten at most every PROGRESS_FLUSH_SECONDS, plus once at the end,
+        # and only when a status actually changed since the last write (revision ahead).
+        self._progress_rev = 0
+        self._progress_written_rev = 0
+        self._last_flush = time.monotonic()
+        self._last_percent = -1
+        try:
+            self._cache: CommentCache | None = CommentCache()
+        except sqlite3.Error:
+            # Without a usable cache file every reflection is simply sent to the API.
+            self._cache = None
         self._client = DeepSeekClient(
             DeepSeekConfig(
                 base_url=base_url,
@@ -48,141 +79,322 @@ class BatchWorker(QThread):
                 model=model,
                 timeout_seconds=30,
                 max_retries=2,
-            )
+                max_connections=self.concurrency,
+            ),
+            cache=self._cache,
         )
 
+    def start(self) -> None:
+        self._thread = QThread()
+        self.moveToThread(self._thread)
+        self._thread.started.connect(self._run)
+        self._thread.start()
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.wait()
+
     def pause(self) -> None:
-        self._paused = True
+        with QMutexLocker(self._pause_mutex):
+            self._paused = True
 
     def resume(self) -> None:
-        self._paused = False
+        with QMutexLocker(self._pause_mutex):
+            self._paused = False
+            self._pause_cond.wakeAll()
 
     def stop(self) -> None:
-        self._stop_requested = True
+        with QMutexLocker(self._pause_mutex):
+            self._stop_requested = True
+            self._pause_cond.wakeAll()
+
+    def close(self) -> None:
+        self._client.close()
+        if self._cache is not None:
+            self._cache.close()
+
+    def _run(self) -> None:
+        try:
+            self._run_batch()
+        finally:
+            # Leave the thread's event loop so wait() returns even if the batch failed.
+            self._thread.quit()
 
-    def run(self) -> None:
+    def _run_batch(self) -> None:
         output_dir = self.input_dir / "output"
         progress_path = output_dir / "progress.json"
         progress = self._load_progress(progress_path)
 
         self.log_message.emit("正在扫描文件夹...")
-        files = self._collect_files(self.input_dir, output_dir)
-        total = len(files)
+        jobs = self._collect_files(self.input_dir, output_dir)
+        total = len(jobs)
         if total == 0:
             self.log_message.emit("未找到可处理的 .docx 文件。")
             self.finished_all.emit()
             return
 
         self.log_message.emit(f"找到 {total} 个 .docx 文件。")
-        processed = 0
-        for doc_path in files:
-            if self._stop_requested:
-                break
-            while self._paused:
-                self.msleep(200)
-                if self._stop_requested:
-                    break
-            if self._stop_requested:
-                break
+        todo = [job for job in jobs if progress.get(job[1], {}).get("status") != "completed"]
+        try:
+            self._process_jobs(jobs, todo, progress, progress_path, output_dir, total)
+        finally:
+            # Whatever ended the run (done, stopped or failed), persist the last statuses.
+            self._maybe_flush_progress(progress_path, progress, force=True)
 
-            rel_key = str(doc_path.relative_to(self.input_dir))
-            if progress.get(rel_key, {}).get("status") == "completed":
-                processed += 1
-                self._emit_progress(processed, total, doc_path.name, "已完成，跳过。")
-                continue
+        self.finished_all.emit()
 
-            self.current_file_changed.emit(doc_path.name)
-            try:
-                reflection = extract_reflection_text(
+    def _process_jobs(
+        self,
+        jobs: List[Tuple[Path, str]],
+        todo: List[Tuple[Path, str]],
+        progress: Dict[str, Dict[str, str]],
+        progress_path: Path,
+        output_dir: Path,
+        total: int,
+    ) -> None:
+        processed = 0
+        pending: Dict[Future, List[Tuple[Path, str]]] = {}
+        # Extraction takes milliseconds per file while an API slot takes seconds, so the pool
+        # only has to keep up with `concurrency` slots; every extra process is a full
+        # interpreter (Qt, python-docx, lxml) started for nothing.
+        extract_pool = ProcessPoolExecutor(
+            max_workers=max(1, min(self.concurrency, os.cpu_count() or 1, len(todo))),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        with extract_pool, ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Extraction is read-only and lxml-bound, so it runs ahead in separate processes
+            # (outside the GIL) and a reflection is ready whenever an API slot frees up.
+            extractions: Dict[str, Future] = {
+                rel_key: extract_pool.submit(
+                    extract_reflection_text,
                     doc_path,
                     start_marker=self.start_marker,
                     end_marker=self.end_marker,
                 )
-                if not reflection:
-                    self._log_and_mark(
-                        progress,
-                        progress_path,
-                        rel_key,
-                        "skipped_reflection_missing",
-                        "未找到反思内容，跳过。",
-                    )
+                for doc_path, rel_key in todo
+            }
+            # Files sent to the API together; a chunk is submitted once batch_size is reached.
+            chunk: List[Tuple[Path, str, Future]] = []
+            for doc_path, rel_key in jobs:
+                if self._stop_requested:
+                    break
+                if rel_key not in extractions:
                     processed += 1
-                    self._emit_progress(processed, total, doc_path.name, "未找到反思内容。")
+                    self._emit_progress(processed, total, doc_path.name, "已完成，跳过。")
                     continue
 
-                comment = self._client.generate_comment(
-                    reflection_text=reflection,
-                    style=self.style,
-                    expected_words=self.expected_words,
-                )
-                saved_path = insert_comment_and_save(
-                    doc_path,
-                    comment,
-                    output_dir,
-                    comment_label=self.comment_label,
-                    overwrite_output=self.overwrite_output,
-                )
-                if not saved_path:
-                    self._log_and_mark(
-                        progress,
-                        progress_path,
-                        rel_key,
-                        "skipped_insert_failed",
-                        "未找到教师总评插入位置，跳过。",
-                    )
-                else:
-                    self._log_and_mark(
-                        progress,
-                        progress_path,
-                        rel_key,
-                        "completed",
-                        f"已保存：{saved_path.name}",
-                    )
+                if not chunk:
+                    # Keep at most `concurrency` requests in flight; pause/stop are checked once
+                    # a slot frees up, so they take effect after the files already being processed.
+                    while len(pending) >= self.concurrency:
+                        processed = self._collect_finished(pending, progress, progress_path, processed, total)
+                    processed = self._wait_while_paused(pending, progress, progress_path, processed, total)
+                    if self._stop_requested:
+                        break
+
+                self.current_file_changed.emit(doc_path.name)
+                chunk.append((doc_path, rel_key, extractions.pop(rel_key)))
+                if len(chunk) >= self.batch_size:
+                    self._submit_chunk(executor, pending, chunk, output_dir)
+                    chunk = []
+
+            if chunk and not self._stop_requested:
+                self._submit_chunk(executor, pending, chunk, output_dir)
+            else:
+                extractions.update((rel_key, extraction) for _, rel_key, extraction in chunk)
+            # Stopped early: drop the extractions that no file will consume.
+            for extraction in extractions.values():
+                extraction.cancel()
+            while pending:
+                processed = self._collect_finished(pending, progress, progress_path, processed, total)
+
+    def _wait_while_paused(
+        self,
+        pending: Dict[Future, List[Tuple[Path, str]]],
+        progress: Dict[str, Dict[str, str]],
+        progress_path: Path,
+        processed: int,
+        total: int,
+    ) -> int:
+        while True:
+            with QMutexLocker(self._pause_mutex):
+                if not self._paused or self._stop_requested:
+                    return processed
+                if not pending:
+                    # Nothing in flight: persist what is done, then sleep until resume()/stop().
+                    self._maybe_flush_progress(progress_path, progress, force=True)
+                    self._pause_cond.wait(self._pause_mutex)
+                    continue
+            # Files sent before the pause keep finishing; report and record them as they do.
+            processed = self._collect_finished(pending, progress, progress_path, processed, total, timeout=0.2)
+
+    def _submit_chunk(
+        self,
+        executor: ThreadPoolExecutor,
+        pending: Dict[Future, List[Tuple[Path, str]]],
+        chunk: List[Tuple[Path, str, Future]],
+        output_dir: Path,
+    ) -> None:
+        future = executor.submit(
+            self._process_chunk,
+            [(doc_path, extraction) for doc_path, _, extraction in chunk],
+            output_dir,
+        )
+        pending[future] = [(doc_path, rel_key) for doc_path, rel_key, _ in chunk]
+
+    def _process_chunk(
+        self,
+        items: List[Tuple[Path, Future]],
+        output_dir: Path,
+    ) -> List[Union[Tuple[str, str, str], Exception, None]]:
+        """Process a chunk of files with one API request; returns one outcome per file."""
+        outcomes: List[Union[Tuple[str, str, str], Exception, None]] = [None] * len(items)
+        reflections: Dict[int, str] = {}
+        for idx, (_, extraction) in enumerate(items):
+            try:
+                reflection = extraction.result()
             except Exception as exc:
-                if isinstance(exc, PermissionError):
-                    self.attention_message.emit(f"{doc_path.name} 无法写入，请关闭文档后重试。")
-                self._log_and_mark(
-                    progress,
-                    progress_path,
-                    rel_key,
-                    "error",
-                    f"处理失败：{exc}",
-                )
+                outcomes[idx] = exc
+                continue
+            if reflection:
+                reflections[idx] = reflection
+            else:
+                outcomes[idx] = ("skipped_reflection_missing", "未找到反思内容，跳过。", "未找到反思内容。")
+        if not reflections:
+            return outcomes
 
-            processed += 1
-            self._emit_progress(processed, total, doc_path.name, "完成。")
+        try:
+            comments = self._client.generate_comments_batch(
+                list(reflections.values()),
+                style=self.style,
+                expected_words=self.expected_words,
+            )
+        except Exception as exc:
+            for idx in reflections:
+                outcomes[idx] = exc
+            return outcomes
 
-        self.finished_all.emit()
+        for idx, comment in zip(reflections, comments):
+            if isinstance(comment, Exception):
+                outcomes[idx] = comment
+                continue
+            try:
+                outcomes[idx] = self._save_comment(items[idx][0], comment, output_dir)
+            except Exception as exc:
+                outcomes[idx] = exc
+        return outcomes
 
-    def _emit_progress(self, processed: int, total: int, filename: str, note: str) -> None:
-        percent = int((processed / total) * 100)
-        self.progress_changed.emit(percent)
-        self.log_message.emit(f"{filename} - {note}")
+    def _save_comment(self, doc_path: Path, comment: str, output_dir: Path) -> Tuple[str, str, str]:
+        # The full package is only loaded once there is a comment to write into it.
+        doc = open_document(doc_path)
+        # Output names are picked from what already exists on disk, so saves
+        # must not interleave between worker threads.
+        with self._save_lock:
+            saved_path = insert_comment_and_save(
+                doc,
+                doc_path,
+                comment,
+                output_dir,
+                comment_label=self.comment_label,
+                overwrite_output=self.overwrite_output,
+            )
+        if not saved_path:
+            return "skipped_insert_failed", "未找到教师总评插入位置，跳过。", "完成。"
+        return "completed", f"已保存：{saved_path.name}", "完成。"
 
-    def _log_and_mark(
+    def _collect_finished(
+        self,
+        pending: Dict[Future, List[Tuple[Path, str]]],
+        progress: Dict[str, Dict[str, str]],
+        progress_path: Path,
+        processed: int,
+        total: int,
+        timeout: float | None = None,
+    ) -> int:
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            files = pending.pop(future)
+            for (doc_path, rel_key), outcome in zip(files, future.result()):
+                note = "完成。"
+                if isinstance(outcome, Exception):
+                    if isinstance(outcome, PermissionError):
+                        self.attention_message.emit(f"{doc_path.name} 无法写入，请关闭文档后重试。")
+                    status, message = "error", f"处理失败：{outcome}"
+                else:
+                    status, message, note = outcome
+                self._mark_progress(progress, progress_path, rel_key, status)
+                processed += 1
+                self._emit_progress(processed, total, doc_path.name, note, message)
+        return processed
+
+    def _emit_progress(
+        self,
+        processed: int,
+        total: int,
+        filename: str,
+        note: str,
+        message: str | None = None,
+    ) -> None:
+        messages = [message] if message else []
+        messages.append(f"{filename} - {note}")
+        update: Dict[str, object] = {"messages": messages}
+        # Exact integer math: float division can land just below a whole percent (29/50 -> 57).
+        percent = processed * 100 // total
+        if percent != self._last_percent:
+            self._last_percent = percent
+            update["percent"] = percent
+        self.batch_update.emit(update)
+
+    def _mark_progress(
         self,
         progress: Dict[str, Dict[str, str]],
         progress_path: Path,
         key: str,
         status: str,
-        message: str,
     ) -> None:
-        progress[key] = {"status": status}
+        entry = {"status": status}
+        if progress.get(key) != entry:
+            progress[key] = entry
+            self._progress_rev += 1
+        self._maybe_flush_progress(progress_path, progress)
+
+    def _maybe_flush_progress(
+        self,
+        progress_path: Path,
+        progress: Dict[str, Dict[str, str]],
+        force: bool = False,
+    ) -> None:
+        if self._progress_rev == self._progress_written_rev:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.PROGRESS_FLUSH_SECONDS:
+            return
         self._save_progress(progress_path, progress)
-        self.log_message.emit(message)
+        self._progress_written_rev = self._progress_rev
+        self._last_flush = now
 
     @staticmethod
-    def _collect_files(input_dir: Path, output_dir: Path) -> List[Path]:
-        files: List[Path] = []
-        for path in input_dir.rglob("*.docx"):
-            if path.name.startswith("~$"):
-                continue
+    def _collect_files(input_dir: Path, output_dir: Path) -> List[Tuple[Path, str]]:
+        """Return sorted ``(path, progress key)`` pairs; the key is the path relative to input_dir."""
+        # Walk with os.scandir so output/ is pruned on entry instead of filtered per file.
+        # Symlinked directories are not followed and unreadable ones are skipped. normcase
+        # keeps the output check case-insensitive on Windows, like relative_to() was.
+        output_key = os.path.normcase(str(output_dir))
+        files: List[Tuple[Path, str]] = []
+        stack = [(str(input_dir), "")]
+        while stack:
+            dir_path, rel_dir = stack.pop()
             try:
-                path.relative_to(output_dir)
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        rel_key = os.path.join(rel_dir, entry.name)
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.normcase(entry.path) != output_key:
+                                stack.append((entry.path, rel_key))
+                        elif os.path.normcase(entry.name).endswith(".docx") and not entry.name.startswith("~$"):
+                            files.append((Path(entry.path), rel_key))
+            except OSError:
                 continue
-            except ValueError:
-                pass
-            files.append(path)
         return sorted(files)
 
     @staticmethod
@@ -190,11 +402,12 @@ class BatchWorker(QThread):
         if not progress_path.exists():
             return {}
         try:
-            return json.loads(progress_path.read_text(encoding="utf-8"))
+            return orjson.loads(progress_path.read_bytes())
         except Exception:
             return {}
 
     @staticmethod
     def _save_progress(progress_path: Path, progress: Dict[str, Dict[str, str]]) -> None:
         progress_path.parent.mkdir(parents=True, exist_ok=True)
-        progress_path.write_text(json.dumps(progress, ensure_ascii=False, indent=2), encoding="utf-8")
+        # A machine-read checkpoint, so it is written compact.
+        progress_path.write_bytes(orjson.dumps(progress))